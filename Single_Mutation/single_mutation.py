@@ -3,46 +3,99 @@ import argparse
 import subprocess
 import sys
 from rich.console import Console
-import glob
 import re
 import time
-from tabulate import tabulate
+import tempfile
+import hashlib
+import shutil
+import functools
+from concurrent.futures import ThreadPoolExecutor
 
 
 console = Console()
 
-def run_foldx_command(command):
+AMINO_ACIDS = ('A', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'K', 'L', 'M', 'N', 'P', 'Q', 'R', 'S', 'T', 'V', 'W', 'Y')
+
+MODEL_NUMBER_RE = re.compile(r'_(\d+)\.pdb$')
+MUTATION_RE = re.compile(r'([A-Z]{2}\d{1,3}[A-Z])')
+MUTATION_PARTS_RE = re.compile(r'^([A-Z]{2})(\d{1,3})([A-Z])$')
+
+DIR_LISTINGS = {}
+
+CACHE_DIR = os.environ.get("FOLDX_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".foldx_cache"))
+
+def run_foldx_command(command, cwd=None):
     """run a FoldX command and return detailed output"""
     try:
-        result = subprocess.run(command, check=True, capture_output=True, text=True)
+        result = subprocess.run(command, check=True, capture_output=True, text=True, cwd=cwd)
         return result
     except subprocess.CalledProcessError as err:
         return err
 
-def repair_pdb(base_pdb_name):
+"""short SHA256 of a file's contents, used to key the FoldX result cache"""
+def file_hash(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()[:16]
+
+"""short hash of the foldx binary on PATH and of rotabase.txt in the working directory (if there is one), so results from a different FoldX install are never reused"""
+@functools.lru_cache(maxsize=None)
+def foldx_identity():
+    foldx_path = shutil.which('foldx')
+    parts = [file_hash(os.path.realpath(foldx_path)) if foldx_path else 'nofoldx']
+    if os.path.exists('rotabase.txt'):
+        parts.append(file_hash('rotabase.txt'))
+    return '_'.join(parts)
+
+"""path of a cache entry; each FoldX install gets its own subfolder of CACHE_DIR"""
+def cache_path(cache_key):
+    return os.path.join(CACHE_DIR, foldx_identity(), cache_key)
+
+"""copy a cached FoldX result to dest, returns False if it has not been cached yet"""
+def cache_fetch(cache_key, dest):
+    cached_file = cache_path(cache_key)
+    if not os.path.exists(cached_file):
+        return False
+    shutil.copyfile(cached_file, dest)
+    return True
+
+"""save a FoldX result in the cache, copying to a temporary name first so an interrupted copy is never picked up"""
+def cache_store(src, cache_key):
+    cached_file = cache_path(cache_key)
+    os.makedirs(os.path.dirname(cached_file), exist_ok=True)
+    shutil.copyfile(src, f"{cached_file}.tmp")
+    os.replace(f"{cached_file}.tmp", cached_file)
+
+def repair_pdb(base_pdb_name, use_cache=True):
     pdb_file = f"{base_pdb_name}.pdb"
+    repaired_file = f"{base_pdb_name}_Repair.pdb"
+    if use_cache:
+        cache_key = f"{file_hash(pdb_file)}_Repair.pdb"
+        if cache_fetch(cache_key, repaired_file):
+            console.log(f"[green]Repaired PDB loaded from cache: {repaired_file}[/green]")
+            return repaired_file
     cmd = ['foldx', '--command=RepairPDB', f'--pdb={pdb_file}']
     result = run_foldx_command(cmd)
     returncode = result.returncode
-    repaired_file = f"{base_pdb_name}_Repair.pdb"
-    if not os.path.exists(repaired_file):
+    try:
+        os.stat(repaired_file)
+    except FileNotFoundError:
         raise FileNotFoundError("Repaired PDB not generated")
     if returncode != 0:
         console.log(f"[red]RepairPDB failed for {pdb_file}[/red]")
     if returncode ==0:
         console.log(f"[green]Repaired PDB: {repaired_file}[/green]")
+        if use_cache:
+            cache_store(repaired_file, cache_key)
     return repaired_file
 
 def make_mutation_list(residues):
-    amino_acids = ['A', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'K', 'L', 'M', 'N', 'P', 'Q', 'R', 'S', 'T', 'V', 'W', 'Y']
-    mutations = []
-    for chain, pos, wt in residues:
-        for aa in amino_acids:
-            if aa != wt:
-                mutations.append(f"{wt}{chain}{pos}{aa};\n")
+    payload = "".join(f"{wt}{chain}{pos}{aa};\n" for chain, pos, wt in residues for aa in AMINO_ACIDS if aa != wt)
     with open("individual_list.txt", "w") as file:
-        file.writelines(mutations)
-    num_lines = len(mutations)
+        file.write(payload)
+    num_lines = payload.count("\n")
     if num_lines % 19 != 0:
         raise ValueError(f"Number of mutations ({num_lines}) is not correct.")
     console.log("[green]Mutation list created: individual_list.txt[/green]")
@@ -56,9 +109,23 @@ def get_mutation_names(mutation_file="individual_list.txt"):
                 mutation_names.append(line)
     return mutation_names
 
+"""names of the files in a directory from one scandir, reused until the directory changes"""
+def list_dir(dirpath="."):
+    key = os.path.abspath(dirpath)
+    mtime_ns = os.stat(key).st_mtime_ns
+    cached = DIR_LISTINGS.get(key)
+    if cached and cached[0] == mtime_ns:
+        return cached[1]
+    with os.scandir(key) as entries:
+        names = tuple(entry.name for entry in entries if entry.is_file())
+    # a listing taken right after a change could miss a later change with the same timestamp, so only keep settled ones
+    if time.time_ns() - mtime_ns > 1_000_000_000:
+        DIR_LISTINGS[key] = (mtime_ns, names)
+    return names
+
 """separate the WT from the mutant files"""
 def file_key(filename):
-    match = re.search(r'_(\d+)\.pdb$', filename)
+    match = MODEL_NUMBER_RE.search(filename)
     if match:
         return int(match.group(1))
     else:
@@ -67,51 +134,139 @@ def file_key(filename):
 """rename mutation files generated as the mutation rather than just numerically"""
 def rename_pdb_files(repaired_pdb, mutation_names):
     base = os.path.splitext(repaired_pdb)[0]
-    pdb_files = glob.glob(f"{base}_*.pdb")
-    pdb_files = sorted(pdb_files, key=file_key)
-    if len(pdb_files) != len(mutation_names):
+    prefix = f"{base}_"
+    numbered_files = []
+    for pdb_file in list_dir():
+        if pdb_file.startswith(prefix) and pdb_file.endswith(".pdb"):
+            number = file_key(pdb_file)
+            if number >= 0:
+                numbered_files.append((number, pdb_file))
+    numbered_files.sort()
+    if len(numbered_files) != len(mutation_names):
         print("Warning: PDB files and mutation names are not equal!")
         return
-    for pdb_file, mutation in zip(pdb_files, mutation_names):
+    renamed = []
+    for (number, pdb_file), mutation in zip(numbered_files, mutation_names):
         new_name = f"{base}_{mutation}.pdb"
-        print(f"Renaming {pdb_file} -> {new_name}")
-        os.rename(pdb_file, new_name)
+        os.replace(pdb_file, new_name)
+        renamed.append(f"{pdb_file} -> {new_name}")
+    console.log("Renamed mutant models:\n" + "\n".join(renamed))
 
-"""generate mutated models based on the mutation in the mutation list"""
-def run_mutations(repaired_pdb):
-    cmd = ['foldx', '--command=BuildModel', f'--pdb={repaired_pdb}', '--mutant-file=individual_list.txt', '--numberOfRuns=1', '--out-pdb=true']
-    result = run_foldx_command(cmd)
-    console.log(f"BuildModel stdout:\n{result.stdout}")
-    console.log(f"BuildModel stderr:\n{result.stderr}")
+"""build the models for one shard of the mutation list in its own directory so FoldX's fixed output names don't collide"""
+def build_shard(repaired_pdb, shard_dir, mutant_file, start, count):
+    base = os.path.splitext(repaired_pdb)[0]
+    cmd = ['foldx', '--command=BuildModel', f'--pdb={repaired_pdb}', f'--pdb-dir={os.getcwd()}', f'--mutant-file={mutant_file}', '--numberOfRuns=1', '--out-pdb=true']
+    result = run_foldx_command(cmd, cwd=shard_dir)
+    console.log(f"BuildModel stdout ({mutant_file}):\n{result.stdout}")
+    console.log(f"BuildModel stderr ({mutant_file}):\n{result.stderr}")
+    # move the numbered models and their WT_ references back next to the WT, renumbered to their position in individual_list.txt
+    for n in range(1, count + 1):
+        for prefix in ("", "WT_"):
+            shard_pdb = os.path.join(shard_dir, f"{prefix}{base}_{n}.pdb")
+            if os.path.exists(shard_pdb):
+                os.rename(shard_pdb, f"{prefix}{base}_{start + n}.pdb")
+    return result
+
+"""merge each shard's BuildModel .fxout tables (Dif_, Raw_, Average_, PdbList_) into one file per table, renumbering the models like build_shard does"""
+def merge_fxout_files(repaired_pdb, shards):
+    base = os.path.splitext(repaired_pdb)[0]
+    model_re = re.compile(rf"{re.escape(base)}_(\d+)(?=[_.\s]|$)")
+    merged = {}
+    for shard_dir, mutant_file, start, count in shards:
+        for name in sorted(os.listdir(shard_dir)):
+            if not name.endswith(".fxout"):
+                continue
+            with open(os.path.join(shard_dir, name)) as file:
+                lines = file.readlines()
+            # the banner and column names end at the 'Pdb' header line, only the first shard's copy is kept
+            header_end = next((i + 1 for i, line in enumerate(lines) if line.startswith("Pdb\t")), 0)
+            rows = [model_re.sub(lambda m: f"{base}_{start + int(m.group(1))}", line.rstrip("\n")) + "\n" for line in lines[header_end:] if line.strip()]
+            merged.setdefault(name, lines[:header_end]).extend(rows)
+    for name, lines in merged.items():
+        with open(name, "w") as file:
+            file.writelines(lines)
+
+"""generate mutated models based on the mutation in the mutation list, split into shards that run in parallel"""
+def run_mutations(repaired_pdb, max_workers=None, use_cache=True):
+    base = os.path.splitext(repaired_pdb)[0]
     mutation_names = get_mutation_names("individual_list.txt")
+    if use_cache:
+        repaired_hash = file_hash(repaired_pdb)
+        mutation_names = [mutation for mutation in mutation_names if not cache_fetch(f"{repaired_hash}_{mutation}.pdb", f"{base}_{mutation}.pdb")]
+        console.log(f"{len(mutation_names)} mutant models to build, the rest were loaded from cache")
+    if not mutation_names:
+        console.log("[green]Mutant Structures Generated[/green]")
+        return
+    workers = max(1, min(max_workers or os.cpu_count() or 1, len(mutation_names)))
+    shard_size = max(1, -(-len(mutation_names) // workers))
+    with tempfile.TemporaryDirectory(prefix="buildmodel_", dir=os.getcwd()) as tmp_dir:
+        shards = []
+        for k, start in enumerate(range(0, len(mutation_names), shard_size)):
+            shard_mutations = mutation_names[start:start + shard_size]
+            shard_dir = os.path.join(tmp_dir, f"shard_{k}")
+            os.mkdir(shard_dir)
+            mutant_file = f"individual_list_{k}.txt"
+            with open(os.path.join(shard_dir, mutant_file), "w") as file:
+                file.writelines(f"{mutation};\n" for mutation in shard_mutations)
+            shards.append((shard_dir, mutant_file, start, len(shard_mutations)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(lambda shard: build_shard(repaired_pdb, *shard), shards))
+        merge_fxout_files(repaired_pdb, shards)
     rename_pdb_files(repaired_pdb, mutation_names)
+    if use_cache:
+        for mutation in mutation_names:
+            if os.path.exists(f"{base}_{mutation}.pdb"):
+                cache_store(f"{base}_{mutation}.pdb", f"{repaired_hash}_{mutation}.pdb")
     console.log("[green]Mutant Structures Generated[/green]")
 
 """stability calculations need retry capabilities because it'll get random errors on different computers"""
-def run_foldx_stability(base_pdb_name, max_retries=3, retry_delay=5):
+def run_stability_with_retries(pdb_file, max_retries=3, retry_delay=5):
+    console.log(f"Running stability calculation for: {pdb_file}")
+    for attempt in range(max_retries):
+        cmd = ['foldx', '--command=Stability', f'--pdb={pdb_file}']
+        result = run_foldx_command(cmd)
+        if result.returncode == 0:
+            console.log(f"[green]Stability calculation completed for {pdb_file}[/green]")
+            return True
+        console.print(f"[yellow]Error running stability calculation for {pdb_file} (Attempt {attempt + 1}/{max_retries}):[/yellow]")
+        if attempt < max_retries - 1:
+            console.print(f"Retrying in {retry_delay} seconds...")
+            time.sleep(retry_delay)
+    return False
+
+"""run every stability calculation in one FoldX process so the startup cost is only paid once, then retry just the PDBs with no output"""
+def run_foldx_stability(base_pdb_name, max_retries=3, retry_delay=5, max_workers=None, use_cache=True):
     file_pattern = f"{base_pdb_name}_Repair*.pdb"
-    matching_files = glob.glob(file_pattern)
+    pdb_re = re.compile(rf'^{re.escape(base_pdb_name)}_Repair.*\.pdb$')
+    matching_files = [name for name in list_dir() if pdb_re.match(name)]
     if not matching_files:
         console.print(f"[red]No files found matching the pattern: {file_pattern}[/red]")
         return None
+    stability_files = {pdb_file: f"{os.path.splitext(pdb_file)[0]}_0_ST.fxout" for pdb_file in matching_files}
+    pending_files = matching_files
+    if use_cache:
+        cache_keys = {pdb_file: f"{file_hash(pdb_file)}_ST.fxout" for pdb_file in matching_files}
+        pending_files = [pdb_file for pdb_file in matching_files if not cache_fetch(cache_keys[pdb_file], stability_files[pdb_file])]
     error_files = []
-    for pdb_file in matching_files:
-        console.log(f"Running stability calculation for: {pdb_file}")
-        success = False
-        for attempt in range(max_retries):
-            cmd = ['foldx', '--command=Stability', f'--pdb={pdb_file}']
-            result = run_foldx_command(cmd)
-            if result.returncode == 0:
-                console.log(f"[green]Stability calculation completed for {pdb_file}[/green]")
-                success = True
-                break
-            else:
-                console.print(f"[yellow]Error running stability calculation for {pdb_file} (Attempt {attempt + 1}/{max_retries}):[/yellow]")
-                if attempt < max_retries - 1:
-                    console.print(f"Retrying in {retry_delay} seconds...")
-                    time.sleep(retry_delay)
-        if not success:
-            error_files.append(pdb_file)
+    if pending_files:
+        pdb_list_file = "stability_pdbs.txt"
+        with open(pdb_list_file, "w") as file:
+            file.writelines(f"{pdb_file}\n" for pdb_file in pending_files)
+        console.log(f"Running stability calculation for {len(pending_files)} PDB files")
+        cmd = ['foldx', '--command=Stability', f'--pdb-list={pdb_list_file}']
+        result = run_foldx_command(cmd)
+        finished = set(list_dir())
+        missing_files = [pdb_file for pdb_file in pending_files if stability_files[pdb_file] not in finished]
+        if result.returncode != 0 or missing_files:
+            console.print(f"[yellow]Batch stability calculation did not finish for {len(missing_files)} files, retrying them individually[/yellow]")
+        if missing_files:
+            with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+                successes = list(executor.map(lambda pdb_file: run_stability_with_retries(pdb_file, max_retries, retry_delay), missing_files))
+            error_files = [pdb_file for pdb_file, success in zip(missing_files, successes) if not success]
+        if use_cache:
+            for pdb_file in pending_files:
+                if pdb_file not in error_files and os.path.exists(stability_files[pdb_file]):
+                    cache_store(stability_files[pdb_file], cache_keys[pdb_file])
     if error_files:
         console.print("[red]The following files failed stability calculation after retries:[/red]")
         for f in error_files:
@@ -121,9 +276,28 @@ def run_foldx_stability(base_pdb_name, max_retries=3, retry_delay=5):
         console.log("[green]All stability calculations finished successfully[/green]")
         return True
 
+"""read the total energy (2nd field) of a FoldX stability file, which holds a single tab separated line per PDB"""
+def read_stability(fxout_file):
+    with open(fxout_file, 'rb') as f:
+        line = f.readline()
+    # only split off the first two fields instead of all of the energy terms
+    fields = line.split(b'\t', 2)
+    if len(fields) < 2:
+        fields = line.split()
+    return float(fields[1])
+
+"""sort key grouping DDG results by amino acid number, highest DDG first within each group"""
+def ddg_sort_key(row):
+    match = MUTATION_PARTS_RE.match(row[0])
+    if match:
+        return int(match.group(2)), -row[2]
+    print(f"Warning: Could not extract number from mutation '{row[0]}' - using 0")
+    return 0, -row[2]
+
 def subtract_fields(file_pattern):
     file1 = f"{file_pattern}_Repair_0_ST.fxout"
-    file2_list = sorted(glob.glob(f"{file_pattern}_Repair_*_0_ST.fxout"))
+    stability_re = re.compile(rf'^{re.escape(file_pattern)}_Repair_.*_0_ST\.fxout$')
+    file2_list = sorted(name for name in list_dir() if stability_re.match(name) and name != file1)
     individual_list_file = "individual_list.txt"
     output_file = "ddgcalcoutput.txt"
     if not file2_list:
@@ -137,57 +311,42 @@ def subtract_fields(file_pattern):
                 individual_lines.append(cleaned_line)
     results = []
     headers = ["Mutation", "Source File", "Stability (DDG)"]
-    mutation_lookup = {}
-    for mut in individual_lines:
-        mutation_lookup[mut] = mut
+    mutation_set = set(individual_lines)
+    try:
+        wt_value = read_stability(file1)
+    except (OSError, IndexError, ValueError) as err:
+        print(f"Could not read WT stability from {file1}: {err}")
+        return
     for file2 in file2_list:
         if file2.endswith("Repair_0_ST.fxout"):
             continue
-        match = re.search(r'([A-Z]{2}\d{1,3}[A-Z])', file2)
-        if not match:
-            print(f"Warning: Could not extract mutation code from filename: {file2}")
-            continue
-        mutation_code = match.group(1)
-        individual_text = mutation_lookup.get(mutation_code, mutation_code)
-        with open(file1, 'r') as f1, open(file2, 'r') as f2:
-            for line1, line2 in zip(f1, f2):
-                fields1 = line1.strip().split()
-                fields2 = line2.strip().split()
-                if len(fields1) < 2 or len(fields2) < 2:
-                    print(f"Skipping line due to insufficient fields in {file2}: {line1.strip()} or {line2.strip()}")
-                    continue
-                try:
-                    value1 = float(fields1[1])
-                    value2 = float(fields2[1])
-                    result = value2 - value1
-                    results.append([individual_text, file2, result])
-                except ValueError:
-                    print(f"Skipping line due to non-numeric value in {file2}: {line1.strip()} or {line2.strip()}")
+        # the mutation is one of the _ separated parts of the name, so a set lookup finds it without the regex
+        individual_text = next((token for token in file2[len(file_pattern):].split('_') if token in mutation_set), None)
+        if individual_text is None:
+            match = MUTATION_RE.search(file2)
+            if not match:
+                print(f"Warning: Could not extract mutation code from filename: {file2}")
+                continue
+            individual_text = match.group(1)
+        try:
+            results.append([individual_text, file2, read_stability(file2) - wt_value])
+        except (IndexError, ValueError):
+            print(f"Skipping {file2} due to a missing or non-numeric stability value")
         console.log(f"[cyan]Processed {file2}[/cyan]")
 #"""grouping results first by amino acid number and then sorting by DDG within each group"""
-    groups = {}
-    for row in results:
-        mutation = row[0]
-        match = re.match(r'^([A-Z]{2})(\d{1,3})([A-Z])$', mutation)
-        if match:
-            num = int(match.group(2))
-            groups.setdefault(num, []).append(row)
-        else:
-            print(f"Warning: Could not extract number from mutation '{mutation}' - using 0")
-            groups.setdefault(0, []).append(row)
-    sorted_groups = sorted(groups.items(), key=lambda x: x[0])
-    final_results = []
-    for num, group_rows in sorted_groups:
-        sorted_group = sorted(group_rows, key=lambda x: -x[2])
-        final_results.extend(sorted_group)
+    final_results = sorted(results, key=ddg_sort_key)
     formatted_results = [[row[0], row[1], f"{row[2]:.4f}"] for row in final_results]
     column_widths = [len(header) for header in headers]
     for row in formatted_results:
         for i, cell in enumerate(row):
             column_widths[i] = max(column_widths[i], len(cell))
     bottom_line = ["-" * width for width in column_widths]
+    # text columns left aligned and the DDG column right aligned, two spaces between columns
+    row_format = "  ".join([f"{{:<{width}}}" for width in column_widths[:-1]] + [f"{{:>{column_widths[-1]}}}"])
     with open(output_file, 'w') as out:
-        out.write(tabulate(formatted_results, headers=headers, tablefmt="plain") + "\n")
+        out.write(row_format.format(*headers) + "\n")
+        for row in formatted_results:
+            out.write(row_format.format(*row) + "\n")
         out.write("  ".join(bottom_line) + "\n")
     console.log(f"[cyan]All results written to {output_file}[/cyan]")
     console.log("[green]DDG calculations completed[/green]")
@@ -196,12 +355,15 @@ def main():
     parser = argparse.ArgumentParser(description='FoldX Comprehensive Mutagenesis')
     parser.add_argument('--pdb_file', required=True, help='Input PDB file')
     parser.add_argument('--residues', required=True, nargs='+', help='Residues in ChainID:Position:WT format (e.g., A:214:E)')
+    parser.add_argument('--no_cache', action='store_true', help=f'Always rerun FoldX instead of reusing results cached in {CACHE_DIR}')
     args = parser.parse_args()
-    base_pdb_name = os.path.splitext(os.path.basename(args.pdb_file))[0]
-    if not os.path.exists(f"{base_pdb_name}.pdb"):
+    base_pdb_name, extension = os.path.splitext(os.path.basename(args.pdb_file))
+    try:
+        os.stat(f"{base_pdb_name}.pdb")
+    except FileNotFoundError:
         console.print(f"[red]Error: PDB file {base_pdb_name}.pdb not found![/red]")
         sys.exit(1)
-    if not os.path.splitext(os.path.basename(args.pdb_file))[1] == ".pdb":
+    if not extension == ".pdb":
         console.print(f"[red]Error: This is not a .pdb file![/red]")
         sys.exit(1)
     residues = []
@@ -216,16 +378,14 @@ def main():
             sys.exit(1)
     try:
         with console.status("[bold magenta]Repairing PDB...[/bold magenta]", spinner="dots"):
-            repaired_pdb = repair_pdb(base_pdb_name)
-        if not os.path.exists(repaired_pdb):
-            console.print(f"[red]Repaired PDB file not found: {repaired_pdb}[/red]")
-            sys.exit(1)
+            # repair_pdb raises FileNotFoundError if the repaired PDB was not generated
+            repaired_pdb = repair_pdb(base_pdb_name, use_cache=not args.no_cache)
         with console.status("[bold magenta]Generating mutation list...[/bold magenta]", spinner="dots"):
             make_mutation_list(residues)
         with console.status("[bold magenta]Building mutated models...[/bold magenta]", spinner="dots"):
-            run_mutations(repaired_pdb)
+            run_mutations(repaired_pdb, use_cache=not args.no_cache)
         with console.status("[bold magenta]Running stability calculations...[/bold magenta]", spinner="dots"):
-            run_foldx_stability(base_pdb_name)
+            run_foldx_stability(base_pdb_name, use_cache=not args.no_cache)
         with console.status("[bold magenta]Running DDG calculations...[/bold magenta]", spinner="dots"):
             subtract_fields(base_pdb_name)
     except Exception as e:
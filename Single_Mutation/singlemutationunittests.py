@@ -1,31 +1,60 @@
+import os
 import unittest
+import tempfile
 from unittest.mock import patch, mock_open, MagicMock, call
-from single_mutation import (repair_pdb, make_mutation_list, file_key, get_mutation_names, rename_pdb_files, run_mutations, run_foldx_stability)
+from single_mutation import (repair_pdb, make_mutation_list, file_key, get_mutation_names, rename_pdb_files, run_mutations, build_shard, merge_fxout_files, run_foldx_stability, read_stability, ddg_sort_key, foldx_identity, cache_path)
 
 class TestFoldXWorkflow(unittest.TestCase):
 
-    @patch("os.path.exists", return_value=True)
+    @patch("os.stat")
     @patch("builtins.open", new_callable=mock_open)
     @patch("subprocess.run")
     @patch("os.rename")
-    def test_repair_pdb_success(self, mock_rename, mock_run, mock_file, mock_exists):
+    def test_repair_pdb_success(self, mock_rename, mock_run, mock_file, mock_stat):
         mock_run.return_value = MagicMock(returncode=0, stdout="", stderr="")
+        with patch("rich.console.Console.log"):
+            repaired = repair_pdb("test", use_cache=False)
+        self.assertEqual(repaired, "test_Repair.pdb")
+
+    @patch("single_mutation.cache_fetch", return_value=True)
+    @patch("single_mutation.file_hash", return_value="abc")
+    @patch("single_mutation.run_foldx_command")
+    def test_repair_pdb_from_cache(self, mock_run_foldx_command, mock_hash, mock_fetch):
         with patch("rich.console.Console.log"):
             repaired = repair_pdb("test")
         self.assertEqual(repaired, "test_Repair.pdb")
+        mock_fetch.assert_called_once_with("abc_Repair.pdb", "test_Repair.pdb")
+        mock_run_foldx_command.assert_not_called()
 
     @patch("os.path.exists", return_value=False)
-    def test_repair_pdb_file_not_found(self, mock_exists):
+    @patch("os.path.realpath", side_effect=lambda path: path)
+    @patch("shutil.which")
+    @patch("single_mutation.file_hash", side_effect=lambda path: f"hash-of-{path}")
+    def test_cache_path_keyed_by_foldx_binary(self, mock_hash, mock_which, mock_realpath, mock_exists):
+        paths = []
+        for binary in ("/opt/foldx4/foldx", "/opt/foldx5/foldx"):
+            mock_which.return_value = binary
+            foldx_identity.cache_clear()
+            paths.append(cache_path("abc_Repair.pdb"))
+        foldx_identity.cache_clear()
+        self.assertNotEqual(paths[0], paths[1])
+        self.assertTrue(all(path.endswith("abc_Repair.pdb") for path in paths))
+
+    @patch("os.stat", side_effect=FileNotFoundError)
+    @patch("single_mutation.run_foldx_command")
+    def test_repair_pdb_file_not_found(self, mock_run_foldx_command, mock_stat):
+        mock_run_foldx_command.return_value = MagicMock(returncode=0, stdout="", stderr="")
         with self.assertRaises(FileNotFoundError):
-            repair_pdb("test")
+            repair_pdb("test", use_cache=False)
 
     @patch("builtins.open", new_callable=mock_open)
     def test_make_mutation_list(self, mock_file):
         residues = [("A", 469, "R")]
         make_mutation_list(residues)
-        mock_file().writelines.assert_called()
-        args = mock_file().writelines.call_args[0][0]
-        self.assertTrue(any("RA469L" in line for line in args))
+        mock_file().write.assert_called_once()
+        payload = mock_file().write.call_args[0][0]
+        self.assertIn("RA469L;\n", payload)
+        self.assertEqual(payload.count("\n"), 19)
 
     def test_file_key_with_number(self):
         self.assertEqual(file_key("foo_123.pdb"), 123)
@@ -38,44 +67,113 @@ class TestFoldXWorkflow(unittest.TestCase):
         names = get_mutation_names("file.txt")
         self.assertEqual(names, ["A1B", "B2C"])
 
-    @patch("glob.glob", return_value=["base_1.pdb", "base_2.pdb"])
-    @patch("os.rename")
-    def test_rename_pdb_files(self, mock_rename, mock_glob):
+    @patch("single_mutation.list_dir", return_value=("base_Repair.pdb", "base_Repair_2.pdb", "base_Repair_1.pdb", "other_3.pdb"))
+    @patch("os.replace")
+    def test_rename_pdb_files(self, mock_replace, mock_list_dir):
         rename_pdb_files("base_Repair.pdb", ["mutation1", "mutation2"])
-        mock_rename.assert_has_calls([
-            call('base_1.pdb', 'base_Repair_mutation1.pdb'),
-            call('base_2.pdb', 'base_Repair_mutation2.pdb')
+        mock_replace.assert_has_calls([
+            call('base_Repair_1.pdb', 'base_Repair_mutation1.pdb'),
+            call('base_Repair_2.pdb', 'base_Repair_mutation2.pdb')
         ])
-        assert mock_rename.call_count == 2
+        assert mock_replace.call_count == 2
 
-    @patch("os.rename")  # <-- Added to prevent FileNotFoundError
+    @patch("os.replace")  # <-- Added to prevent FileNotFoundError
     @patch("single_mutation.run_foldx_command")
     @patch("builtins.open", new_callable=mock_open, read_data="RA468B;\nMA2C;\n")
-    @patch("glob.glob", return_value=["base_Repair_1.pdb", "base_Repair_2.pdb"])
-    def test_run_mutations(self, mock_glob, mock_file, mock_run_foldx_command, mock_rename):
+    @patch("single_mutation.list_dir", return_value=("base_Repair_1.pdb", "base_Repair_2.pdb"))
+    def test_run_mutations(self, mock_list_dir, mock_file, mock_run_foldx_command, mock_replace):
         mock_result = MagicMock(returncode=0, stdout="ok", stderr="")
         mock_run_foldx_command.return_value = mock_result
-        run_mutations("base_Repair.pdb")
+        run_mutations("base_Repair.pdb", use_cache=False)
         mock_run_foldx_command.assert_called()
-        mock_rename.assert_has_calls([
+        mock_replace.assert_has_calls([
             call('base_Repair_1.pdb', 'base_Repair_RA468B.pdb'),
             call('base_Repair_2.pdb', 'base_Repair_MA2C.pdb')
         ])
-        assert mock_rename.call_count == 2
+        assert mock_replace.call_count == 2
+
+    @patch("single_mutation.cache_fetch", return_value=True)
+    @patch("single_mutation.file_hash", return_value="abc")
+    @patch("single_mutation.run_foldx_command")
+    @patch("builtins.open", new_callable=mock_open, read_data="RA468B;\nMA2C;\n")
+    def test_run_mutations_from_cache(self, mock_file, mock_run_foldx_command, mock_hash, mock_fetch):
+        run_mutations("base_Repair.pdb")
+        mock_fetch.assert_has_calls([
+            call('abc_RA468B.pdb', 'base_Repair_RA468B.pdb'),
+            call('abc_MA2C.pdb', 'base_Repair_MA2C.pdb')
+        ])
+        mock_run_foldx_command.assert_not_called()
 
-    @patch("glob.glob", return_value=["foo_Repair_1.pdb"])
+    @patch("os.path.exists", return_value=True)
+    @patch("os.rename")
+    @patch("single_mutation.run_foldx_command")
+    def test_build_shard_renumbers_models(self, mock_run_foldx_command, mock_rename, mock_exists):
+        mock_run_foldx_command.return_value = MagicMock(returncode=0, stdout="ok", stderr="")
+        build_shard("base_Repair.pdb", "shard_1", "individual_list_1.txt", 2, 2)
+        self.assertEqual(mock_run_foldx_command.call_args.kwargs["cwd"], "shard_1")
+        mock_rename.assert_has_calls([
+            call(os.path.join("shard_1", "base_Repair_1.pdb"), 'base_Repair_3.pdb'),
+            call(os.path.join("shard_1", "WT_base_Repair_1.pdb"), 'WT_base_Repair_3.pdb'),
+            call(os.path.join("shard_1", "base_Repair_2.pdb"), 'base_Repair_4.pdb'),
+            call(os.path.join("shard_1", "WT_base_Repair_2.pdb"), 'WT_base_Repair_4.pdb')
+        ])
+
+    def test_merge_fxout_files(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            shards = []
+            for k, start in enumerate((0, 2)):
+                shard_dir = os.path.join(tmp_dir, f"shard_{k}")
+                os.mkdir(shard_dir)
+                with open(os.path.join(shard_dir, "Dif_base_Repair.fxout"), "w") as file:
+                    file.write("FoldX banner\n\nPdb\ttotal energy\nbase_Repair_1.pdb\t1.0\nbase_Repair_2.pdb\t2.0\n")
+                shards.append((shard_dir, f"individual_list_{k}.txt", start, 2))
+            cwd = os.getcwd()
+            os.chdir(tmp_dir)
+            try:
+                merge_fxout_files("base_Repair.pdb", shards)
+                with open("Dif_base_Repair.fxout") as file:
+                    merged = file.read()
+            finally:
+                os.chdir(cwd)
+        self.assertEqual(merged, "FoldX banner\n\nPdb\ttotal energy\nbase_Repair_1.pdb\t1.0\nbase_Repair_2.pdb\t2.0\nbase_Repair_3.pdb\t1.0\nbase_Repair_4.pdb\t2.0\n")
+
+    @patch("builtins.open", new_callable=mock_open)
+    @patch("single_mutation.list_dir", side_effect=[("foo_Repair.pdb", "foo_Repair_1.pdb"), ("foo_Repair.pdb", "foo_Repair_1.pdb", "foo_Repair_0_ST.fxout", "foo_Repair_1_0_ST.fxout")])
     @patch("single_mutation.run_foldx_command")
-    def test_run_foldx_stability_success(self, mock_run_foldx_command, mock_glob):
+    def test_run_foldx_stability_success(self, mock_run_foldx_command, mock_list_dir, mock_file):
         mock_result = MagicMock(returncode=0)
         mock_run_foldx_command.return_value = mock_result
-        result = run_foldx_stability("foo")
+        result = run_foldx_stability("foo", use_cache=False)
+        self.assertTrue(result)
+        mock_run_foldx_command.assert_called_once_with(['foldx', '--command=Stability', '--pdb-list=stability_pdbs.txt'])
+
+    @patch("builtins.open", new_callable=mock_open)
+    @patch("single_mutation.list_dir", side_effect=[("foo_Repair.pdb", "foo_Repair_1.pdb"), ("foo_Repair.pdb", "foo_Repair_1.pdb", "foo_Repair_0_ST.fxout")])
+    @patch("single_mutation.run_foldx_command")
+    def test_run_foldx_stability_retries_missing(self, mock_run_foldx_command, mock_list_dir, mock_file):
+        mock_run_foldx_command.side_effect = [MagicMock(returncode=1), MagicMock(returncode=0)]
+        result = run_foldx_stability("foo", use_cache=False)
         self.assertTrue(result)
+        mock_run_foldx_command.assert_called_with(['foldx', '--command=Stability', '--pdb=foo_Repair_1.pdb'])
+        self.assertEqual(mock_run_foldx_command.call_count, 2)
 
-    @patch("glob.glob", return_value=[])
-    def test_run_foldx_stability_no_files(self, mock_glob):
+    @patch("single_mutation.list_dir", return_value=())
+    def test_run_foldx_stability_no_files(self, mock_list_dir):
         result = run_foldx_stability("foo")
         self.assertIsNone(result)
 
+    @patch("builtins.open", new_callable=mock_open, read_data=b"./foo_Repair.pdb\t-12.5\t1.0\t2.0\n")
+    def test_read_stability(self, mock_file):
+        self.assertEqual(read_stability("foo_Repair_0_ST.fxout"), -12.5)
+
+    @patch("builtins.open", new_callable=mock_open, read_data=b"./foo_Repair.pdb   -12.5   1.0\n")
+    def test_read_stability_space_separated(self, mock_file):
+        self.assertEqual(read_stability("foo_Repair_0_ST.fxout"), -12.5)
+
+    def test_ddg_sort_key(self):
+        rows = [["RA12C", "a", 1.0], ["RA3C", "b", 0.5], ["RA12D", "c", 2.0]]
+        self.assertEqual([row[0] for row in sorted(rows, key=ddg_sort_key)], ["RA3C", "RA12D", "RA12C"])
+
 
 if __name__ == "__main__":
     unittest.main()
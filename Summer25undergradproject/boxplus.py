@@ -1,4 +1,5 @@
 import argparse
+import functools
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
@@ -7,8 +8,20 @@ import sys
 import re
 from scipy.stats import f_oneway, ttest_ind
 
+EXCEL_RANGE_RE = re.compile(r'^([A-Za-z]+):([A-Za-z]+)$')
+EXCEL_COL_RE = re.compile(r'^[A-Za-z]+$')
+INT_RANGE_RE = re.compile(r'^(\d+):(\d+)$')
+INT_COL_RE = re.compile(r'^\d+$')
+GROUP_ARG_RE = re.compile(r'^\d+(:\d+)?$|^[A-Za-z]+(:[A-Za-z]+)?$')
+
+@functools.lru_cache(maxsize=4096)
 def excel_col_to_idx(col):
     col = col.upper()
+    # fast paths for the one and two letter columns that cover almost every sheet
+    if len(col) == 1 and 'A' <= col <= 'Z':
+        return ord(col) - ord('A')
+    if len(col) == 2 and 'A' <= col[0] <= 'Z' and 'A' <= col[1] <= 'Z':
+        return 26 * (ord(col[0]) - ord('A') + 1) + ord(col[1]) - ord('A')
     total = 0
     for c in col:
         if not ('A' <= c <= 'Z'):
@@ -19,48 +32,49 @@ def excel_col_to_idx(col):
 def expand_column_indices(arg_list, data):
     indices = []
     for item in arg_list:
-        m = re.match(r'^([A-Za-z]+):([A-Za-z]+)$', item)
-        if m:
+        if (m := EXCEL_RANGE_RE.match(item)):
             start_idx = excel_col_to_idx(m.group(1))
             end_idx = excel_col_to_idx(m.group(2)) + 1
             indices.extend(range(start_idx, end_idx))
-        elif re.match(r'^[A-Za-z]+$', item):
+        elif EXCEL_COL_RE.match(item):
             indices.append(excel_col_to_idx(item))
-        elif re.match(r'^(\d+):(\d+)$', item):
-            m = re.match(r'^(\d+):(\d+)$', item)
+        elif (m := INT_RANGE_RE.match(item)):
             start, end = int(m.group(1)), int(m.group(2))
             indices.extend(range(start, end))
-        elif re.match(r'^\d+$', item):
+        elif INT_COL_RE.match(item):
             indices.append(int(item))
         else:
             print(f"Error: Invalid column identifier: '{item}'", file=sys.stderr)
             sys.exit(1)
-    if not all(0 <= idx < len(data.columns) for idx in indices):
+    arr = np.asarray(indices, dtype=np.intp)
+    if ((arr < 0) | (arr >= len(data.columns))).any():
         print(f"Error: Column index out of range. Data has {len(data.columns)} columns.", file=sys.stderr)
         sys.exit(1)
-    return [data.columns[idx] for idx in indices]
+    return list(data.columns.values[arr])
 
 def parse_grouped_columns(args, data):
-    records = []
+    groups = []
     i = 0
     n = len(args)
-    group_order = []
     while i < n:
         group = args[i]
-        group_order.append(group)
         i += 1
         col_args = []
-        while i < n and re.match(r'^\d+(:\d+)?$|^[A-Za-z]+(:[A-Za-z]+)?$', args[i]):
+        while i < n and GROUP_ARG_RE.match(args[i]):
             col_args.append(args[i])
             i += 1
         if not col_args:
             print(f"Error: No column indices specified for group '{group}'", file=sys.stderr)
             sys.exit(1)
+        groups.append((group, col_args))
+    group_order = [group for group, _ in groups]
+    group_frames = []
+    for group, col_args in groups:
         cols = expand_column_indices(col_args, data)
-        for col in cols:
-            for val in data[col].dropna():
-                records.append({'Group': group, 'Value': val})
-    return pd.DataFrame(records), group_order
+        # positional column labels so a CSV column called 'Value' can't clash with melt's value_name
+        sub = data[cols].set_axis(range(len(cols)), axis=1).melt(value_name='Value').dropna(subset=['Value']).assign(Group=group)[['Group', 'Value']]
+        group_frames.append(sub)
+    return pd.concat(group_frames, ignore_index=True), group_order
 
 def get_palette(palette_arg):
     if not palette_arg:
@@ -79,14 +93,16 @@ def get_significance_asterisks(p):
     else:
         return ''
 
-def filter_outliers_iqr(series):
+def filter_outliers_iqr(df_long):
     # Finds values NOT considered outliers, using the 1.5*IQR rule[1][4].
-    q1 = series.quantile(0.25)
-    q3 = series.quantile(0.75)
+    # Quartiles come from one groupby pass over all groups instead of masking the whole frame per group.
+    g = df_long.groupby('Group')['Value']
+    q1 = g.transform('quantile', 0.25)
+    q3 = g.transform('quantile', 0.75)
     iqr = q3 - q1
     lower_bound = q1 - 1.5 * iqr
     upper_bound = q3 + 1.5 * iqr
-    return series[(series >= lower_bound) & (series <= upper_bound)]
+    return df_long[(df_long['Value'] >= lower_bound) & (df_long['Value'] <= upper_bound)]
 
 def add_significance_bar(ax, x1, x2, y, p_value, h=0.05):
     ax.plot([x1, x1, x2, x2], [y, y+h, y+h, y], lw=1.5, c='black')
@@ -112,10 +128,9 @@ def main():
         sys.exit(1)
 
     # Get non-outlier data for stats, but keep original data for plotting
-    nonoutlier_data = {}
-    for group in group_order:
-        vals = df_long[df_long['Group'] == group]['Value']
-        nonoutlier_data[group] = filter_outliers_iqr(vals)
+    clean = filter_outliers_iqr(df_long)
+    nonoutlier_data = {group: np.array([]) for group in group_order}
+    nonoutlier_data.update({group: sub['Value'].values for group, sub in clean.groupby('Group')})
 
     # Remove groups that are empty after outlier removal
     group_data = [ser for ser in [nonoutlier_data[g] for g in group_order] if len(ser)]
@@ -1,21 +1,183 @@
-import pandas as pd
+import csv
+import datetime
 import os
+import re
+import openpyxl
+from concurrent.futures import ProcessPoolExecutor
+
+# recursive file search with os.scandir, which already knows each entry's type (os.walk stats them again)
+def iter_files(root, suffix):
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                subdirs = []
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    elif entry.name.lower().endswith(suffix):
+                        yield entry.path
+        except OSError:
+            continue  # unreadable directory, skipped like os.walk does
+        # reversed so subdirectories are visited in listing order, as with os.walk
+        stack.extend(reversed(subdirs))
+
+MIDNIGHT = datetime.time()
+# text cells read_excel read as missing (pandas' default na_values) or as numbers and booleans
+NA_STRINGS = frozenset(['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+                        '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'])
+INT_TEXT_RE = re.compile(r'^[+-]?\d+$')
+FLOAT_TEXT_RE = re.compile(r'^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$')
+BOOL_TEXT = {'True': True, 'TRUE': True, 'true': True, 'False': False, 'FALSE': False, 'false': False}
+
+def cell_value(value):
+    # read_excel turned whole-number floats into ints and NA-like text into blanks
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str) and value in NA_STRINGS:
+        return None
+    return value
+
+def number_value(value):
+    # a cell of a column read_excel parsed as numbers: '007' -> 7, '1.0' -> 1.0
+    if isinstance(value, str):
+        return int(value) if INT_TEXT_RE.match(value) else float(value)
+    return cell_value(value)
+
+def is_blank(row):
+    return all(value is None for value in row)
+
+# rows after the header; blank rows are kept except at the end of the sheet, which read_excel trimmed
+def data_rows(rows):
+    pending = 0
+    for row in rows:
+        if is_blank(row):
+            pending += 1
+            continue
+        for _ in range(pending):
+            yield ()
+        pending = 0
+        yield row
+
+# first pass over a read-only sheet: its used width and a formatter per column that writes cells the way
+# read_excel + to_csv did (float columns as 3.0, date-only columns as 2024-01-02), without keeping any rows
+def column_formatters(ws):
+    rows = ws.iter_rows(values_only=True)
+    header = next(rows, ())
+    width = max((j + 1 for j, value in enumerate(header) if value is not None), default=0)
+    count = 0
+    nonnull, numeric, number, floating, booltext, firstbool, dated, timed = {}, {}, {}, {}, {}, {}, {}, {}
+    for row in data_rows(rows):
+        count += 1
+        for j, value in enumerate(row):
+            if value is None:
+                continue
+            width = max(width, j + 1)
+            if isinstance(value, str):
+                if value in NA_STRINGS:
+                    continue
+                dated[j] = False
+                if INT_TEXT_RE.match(value):
+                    booltext[j] = False
+                    number[j] = True
+                elif FLOAT_TEXT_RE.match(value):
+                    booltext[j] = False
+                    number[j] = floating[j] = True
+                elif value in BOOL_TEXT:
+                    numeric[j] = False
+                else:
+                    numeric[j] = booltext[j] = False
+            elif isinstance(value, bool):
+                dated[j] = False
+                if count == 1:
+                    firstbool[j] = True
+            elif isinstance(value, (int, float)):
+                dated[j] = booltext[j] = False
+                number[j] = True
+                if isinstance(value, float) and not value.is_integer():
+                    floating[j] = True
+            elif isinstance(value, datetime.datetime):
+                numeric[j] = booltext[j] = False
+                if value.time() != MIDNIGHT:
+                    timed[j] = True
+            else:
+                numeric[j] = booltext[j] = dated[j] = False
+            nonnull[j] = nonnull.get(j, 0) + 1
+    formatters = []
+    for j in range(width):
+        if j not in nonnull:
+            formatters.append(lambda value: None)
+        elif numeric.get(j, True):
+            if floating.get(j) or nonnull[j] < count:
+                # a fraction or a blank made pandas store the column as float64 (bools as 1.0 / 0.0)
+                formatters.append(lambda value: None if cell_value(value) is None else repr(float(number_value(value))))
+            elif number.get(j):
+                # bools among numbers became 1 / 0
+                formatters.append(lambda value: int(value) if isinstance(value, bool) else number_value(value))
+            else:
+                formatters.append(number_value)
+        elif booltext.get(j, True) and not firstbool.get(j):
+            # true / false text became bools, except when the column's first cell was a real bool
+            formatters.append(lambda value: BOOL_TEXT.get(value, cell_value(value)))
+        elif dated.get(j, True) and not timed.get(j):
+            formatters.append(lambda value: None if cell_value(value) is None else value.date().isoformat())
+        else:
+            formatters.append(cell_value)
+    return width, formatters
+
+def header_names(row, width):
+    # read_excel's names for blank ('Unnamed: 2') and repeated ('a.1') header cells
+    names = []
+    counts = {}
+    for j, value in enumerate(row[:width] + (None,) * (width - len(row))):
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        name = f"Unnamed: {j}" if value is None else str(value)
+        if name in counts:
+            counts[name] += 1
+            name = f"{name}.{counts[name] - 1}"
+        else:
+            counts[name] = 1
+        names.append(name)
+    return names
+
+def convert_one_xlsx(xlsx_path):
+    root = os.path.dirname(xlsx_path)
+    try:
+        # read_only streams rows from the xlsx instead of loading whole sheets into memory
+        wb = openpyxl.load_workbook(xlsx_path, read_only=True, data_only=True)
+        try:
+            for ws in wb.worksheets:
+                base = os.path.splitext(os.path.basename(xlsx_path))[0]
+                csv_filename = f"{base}_{ws.title}.csv"
+                csv_path = os.path.join(root, csv_filename)
+                # the stored <dimension> is often stale in files not written by Excel, which would cut rows and columns off
+                ws.reset_dimensions()
+                width, formatters = column_formatters(ws)
+                # '\n' line endings, as to_csv wrote them
+                with open(csv_path, 'w', newline='', encoding='utf-8') as out_file:
+                    writer = csv.writer(out_file, lineterminator='\n')
+                    rows = ws.iter_rows(values_only=True)
+                    header = next(rows, ())
+                    if width == 0:
+                        out_file.write('\n')  # to_csv of an empty sheet
+                    else:
+                        writer.writerow(header_names(header, width))
+                        for row in data_rows(rows):
+                            row = row[:width] + (None,) * (width - len(row))
+                            writer.writerow([format_cell(value) for format_cell, value in zip(formatters, row)])
+                print(f"Converted: {xlsx_path} [{ws.title}] -> {csv_path}")
+        finally:
+            wb.close()
+    except Exception as e:
+        print(f"Failed to convert {xlsx_path}: {e}")
 
 def convert_xlsx_to_csv(start_dir):
-    for root, dirs, files in os.walk(start_dir):
-        for file in files:
-            if file.lower().endswith('.xlsx'):
-                xlsx_path = os.path.join(root, file)
-                try:
-                    excel_data = pd.read_excel(xlsx_path, sheet_name=None, engine='openpyxl')
-                    for sheet_name, df in excel_data.items():
-                        base = os.path.splitext(file)[0]
-                        csv_filename = f"{base}_{sheet_name}.csv"
-                        csv_path = os.path.join(root, csv_filename)
-                        df.to_csv(csv_path, index=False)
-                        print(f"Converted: {xlsx_path} [{sheet_name}] -> {csv_path}")
-                except Exception as e:
-                    print(f"Failed to convert {xlsx_path}: {e}")
+    xlsx_paths = list(iter_files(start_dir, '.xlsx'))
+    # each workbook is independent and parsing is CPU bound, so convert them in separate processes
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        list(executor.map(convert_one_xlsx, xlsx_paths))
 
 if __name__ == "__main__":
     start_directory = input("Enter the starting directory: ").strip()
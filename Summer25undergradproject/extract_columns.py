@@ -1,18 +1,37 @@
 import os
-import csv
 import sys
 import re
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+
+def iter_files(root, suffix):
+    """Yield paths of files under root whose names end with suffix (case-insensitive)."""
+    # scandir entries carry their file type, so unlike os.walk no extra stat call is made per entry
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                subdirs = []
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    elif entry.name.lower().endswith(suffix):
+                        yield entry.path
+        except OSError:
+            continue  # unreadable directory, skipped like os.walk does
+        # reversed so subdirectories are visited in listing order, as with os.walk
+        stack.extend(reversed(subdirs))
 
 def extract_column_from_csv(file_path, column_name):
     """Extract a column from a CSV file given the column header."""
-    values = []
-    with open(file_path, newline='', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        if column_name not in reader.fieldnames:
-            return None  # Column not found
-        for row in reader:
-            values.append(row[column_name])
-    return values
+    # usecols makes the C parser skip every other column; keep_default_na keeps cells like 'NA' as written;
+    # index_col=False stops rows with a trailing delimiter from shifting the first field into the index
+    try:
+        column = pd.read_csv(file_path, usecols=[column_name], dtype=str, keep_default_na=False, index_col=False, encoding='utf-8', engine='c')[column_name]
+    except ValueError:
+        return None  # Column not found
+    return column
 
 def clean_header(header, delete_pattern):
     # if pattern like delete_*_this, replace with capturing group
@@ -32,21 +51,16 @@ def pattern_from_template(template):
 
 def main(start_dir, column_name, pattern_template=""):
     # Find all CSV files
-    csv_files = []
-    for root, dirs, files in os.walk(start_dir):
-        for file in files:
-            if file.lower().endswith('.csv') and file != 'data.csv':
-                csv_files.append(os.path.join(root, file))
+    csv_files = [path for path in iter_files(start_dir, '.csv') if os.path.basename(path) != 'data.csv']
 
-    # Extract columns
+    # Extract columns, reading several files at once so disk waits overlap (the C parser releases the GIL)
     data_dict = {}
-    max_len = 0
-    for file_path in csv_files:
-        col = extract_column_from_csv(file_path, column_name)
+    with ThreadPoolExecutor(max_workers=max(1, min(32, len(csv_files)))) as executor:
+        columns = list(executor.map(lambda file_path: extract_column_from_csv(file_path, column_name), csv_files))
+    for file_path, col in zip(csv_files, columns):
         if col is not None:
             file_key = os.path.splitext(os.path.basename(file_path))[0]
             data_dict[file_key] = col
-            max_len = max(max_len, len(col))
         else:
             print(f"Warning: Column '{column_name}' not found in {file_path}")
 
@@ -64,18 +78,13 @@ def main(start_dir, column_name, pattern_template=""):
     else:
         new_headers = headers
 
-    rows = []
-    for i in range(max_len):
-        row = []
-        for h in headers:
-            row.append(data_dict[h][i] if i < len(data_dict[h]) else "")
-        rows.append(row)
+    # Columns of different lengths are aligned on the row index, shorter ones are padded with empty cells
+    out = pd.concat(data_dict, axis=1) if data_dict else pd.DataFrame()
+    out.columns = new_headers
 
     # Write to data.csv
-    with open('data.csv', 'w', newline='', encoding='utf-8') as out_file:
-        writer = csv.writer(out_file)
-        writer.writerow(new_headers)
-        writer.writerows(rows)
+    # \r\n line endings, as csv.writer wrote them
+    out.to_csv('data.csv', index=False, encoding='utf-8', lineterminator='\r\n')
 
     print("Extracted columns written to data.csv.")
 
@@ -1,10 +1,69 @@
 import argparse
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
+import functools
+import numpy as np
 import sys
 import re
 
+# pandas, matplotlib, seaborn and numba are imported where they are first needed, so --help and
+# argument errors don't pay for them; prange is swapped for numba.prange when the kernels compile
+prange = range
+
+EXCEL_RANGE_RE = re.compile(r'^([A-Za-z]+):([A-Za-z]+)$')
+EXCEL_COL_RE = re.compile(r'^[A-Za-z]+$')
+INT_RANGE_RE = re.compile(r'^(\d+):(\d+)$')
+INT_COL_RE = re.compile(r'^\d+$')
+
+# rows per read_csv chunk for the grouped plots, so only the selected columns of one chunk are in memory at a time
+CHUNK_SIZE = 1_000_000
+# rows kept for the violin KDEs; larger files are randomly subsampled to this many rows
+VIOLIN_MAX_POINTS = 50_000
+# above this many points the scatter plot is drawn as a hexbin density instead of individual markers
+SCATTER_HEXBIN_POINTS = 200_000
+# smallest array (rows x columns) worth importing numba for in sum_count; the import and JIT cache
+# load cost a few tenths of a second, the kernel saves about 5 ms per million values over NumPy
+NUMBA_MIN_VALUES = 20_000_000
+# equal-width bins shared by every group in the histogram
+HIST_BINS = 20
+
+def is_int_or_range(s):
+    """
+    True for a column index ('3') or index range ('2:6') token, the forms that continue a group.
+    """
+    start, sep, end = s.partition(':')
+    return start.isdecimal() and (not sep or end.isdecimal())
+
+@functools.lru_cache(maxsize=None)
+def have_numba():
+    """
+    Whether numba is installed; checked once.
+    """
+    try:
+        import numba
+    except ImportError:
+        return False
+    return True
+
+def njit(**options):
+    """
+    numba.njit(**options), applied on the first call; without numba the plain Python function runs.
+    """
+    def decorate(func):
+        compiled = None
+        @functools.wraps(func)
+        def call(*args):
+            nonlocal compiled
+            if compiled is None:
+                if have_numba():
+                    import numba
+                    global prange
+                    prange = numba.prange
+                    compiled = numba.njit(**options)(func)
+                else:
+                    compiled = func
+            return compiled(*args)
+        return call
+    return decorate
+
 def parse_args():
     parser = argparse.ArgumentParser(description='Flexible grouped plotting script (supports column index ranges).')
     parser.add_argument('file', type=str, help='Path to CSV file')
@@ -14,8 +73,10 @@ def parse_args():
     parser.add_argument('--xlabel', type=str, default=None, help='X-axis label')
     parser.add_argument('--ylabel', type=str, default=None, help='Y-axis label')
     parser.add_argument('--palette', type=str, default=None, help='Color palette or comma-separated list of colors')
+    parser.add_argument('--output', type=str, default=None, help='Save the plot to this file instead of showing it')
     return parser.parse_args()
 
+@functools.lru_cache(maxsize=4096)
 def excel_col_to_idx(col):
     """
     Convert Excel-like column letter (e.g. 'A', 'AA') to 0-based index.
@@ -28,6 +89,31 @@ def excel_col_to_idx(col):
         total = total * 26 + (ord(c) - ord('A') + 1)
     return total - 1
 
+# fastmath without 'nnan', since the v == v test is what skips NaNs
+@njit(cache=True, parallel=True, fastmath={'reassoc', 'contract', 'arcp', 'nsz', 'afn'})
+def sum_count_kernel(a):
+    """
+    Per-column sum and non-NaN count of a 2-D float64 array.
+    """
+    s = np.zeros(a.shape[1])
+    c = np.zeros(a.shape[1], dtype=np.int64)
+    for j in prange(a.shape[1]):
+        for i in range(a.shape[0]):
+            v = a[i, j]
+            if v == v:
+                s[j] += v
+                c[j] += 1
+    return s, c
+
+def sum_count(a):
+    """
+    Per-column NaN-skipping sum and count; the numba kernel for arrays large enough to pay for loading it, else NumPy.
+    """
+    if a.size >= NUMBA_MIN_VALUES and have_numba():
+        return sum_count_kernel(a)
+    mask = ~np.isnan(a)
+    return np.where(mask, a, 0.0).sum(axis=0), mask.sum(axis=0)
+
 def expand_column_indices(arg_list, data):
     """
     Accepts:
@@ -37,54 +123,133 @@ def expand_column_indices(arg_list, data):
       - Excel letter range ('A:C', 'AA:AD')
     Returns field names.
     """
+    cols = data.columns
+    ncols = len(cols)
     indices = []
     for item in arg_list:
         # Excel-style range like 'A:C'
-        m = re.match(r'^([A-Za-z]+):([A-Za-z]+)$', item)
-        if m:
+        if (m := EXCEL_RANGE_RE.match(item)):
             start_idx = excel_col_to_idx(m.group(1))
             end_idx = excel_col_to_idx(m.group(2)) + 1
             indices.extend(range(start_idx, end_idx))
         # Excel-style single ('AA')
-        elif re.match(r'^[A-Za-z]+$', item):
+        elif EXCEL_COL_RE.match(item):
             indices.append(excel_col_to_idx(item))
         # Integer range like '2:5'
-        elif re.match(r'^(\d+):(\d+)$', item):
-            m = re.match(r'^(\d+):(\d+)$', item)
+        elif (m := INT_RANGE_RE.match(item)):
             start, end = int(m.group(1)), int(m.group(2))
             indices.extend(range(start, end))
         # Single integer
-        elif re.match(r'^\d+$', item):
+        elif INT_COL_RE.match(item):
             indices.append(int(item))
         else:
             print(f"Error: Invalid column identifier: '{item}'. Must be index, Excel letter, or range.", file=sys.stderr)
             sys.exit(1)
-    if not all(0 <= idx < len(data.columns) for idx in indices):
-        print(f"Error: Column index out of range. Data has {len(data.columns)} columns.", file=sys.stderr)
+    arr = np.asarray(indices, dtype=np.int64)
+    if ((arr < 0) | (arr >= ncols)).any():
+        print(f"Error: Column index out of range. Data has {ncols} columns.", file=sys.stderr)
         sys.exit(1)
-    return [data.columns[idx] for idx in indices]
+    return [cols[idx] for idx in indices]
 
 
-def parse_grouped_columns(args, data):
-    """For box/bar/histogram: [GroupName colRange1 colRange2 ... GroupName2 colRange3 ...] e.g. 'A' 0:3 5 'B' 3:5"""
-    records = []
+def parse_group_spec(args, data):
+    """For box/bar/histogram: [GroupName colRange1 colRange2 ... GroupName2 colRange3 ...] e.g. 'A' 0:3 5 'B' 3:5
+    Returns (group, column names) pairs; only data.columns is used, so a header-only frame is enough."""
+    group_cols = []
     i = 0
     n = len(args)
     while i < n:
         group = args[i]
         i += 1
         col_args = []
-        while i < n and re.match(r'^(\d+(:\d+)?|\d+)$', args[i]):
+        while i < n and is_int_or_range(args[i]):
             col_args.append(args[i])
             i += 1
         if not col_args:
             print(f"Error: No column indices specified for group '{group}'", file=sys.stderr)
             sys.exit(1)
-        cols = expand_column_indices(col_args, data)
-        for col in cols:
-            for val in data[col].dropna():
-                records.append({'Group': group, 'Value': val})
-    return pd.DataFrame(records)
+        group_cols.append((group, expand_column_indices(col_args, data)))
+    return group_cols
+
+def selected_columns(group_cols):
+    """Column names used by any group, each once, for read_csv(usecols=...)."""
+    return list(dict.fromkeys(col for _, cols in group_cols for col in cols))
+
+def parse_grouped_columns(group_cols, data):
+    """Long-form Group/Value frame of the non-null values in each group's columns."""
+    import pandas as pd
+    pieces = []
+    for group, cols in group_cols:
+        # one melt per group; positional labels keep a data column named 'Value' from clashing with melt's output
+        values = data[cols].set_axis(range(len(cols)), axis=1).melt(value_name='Value')['Value'].to_numpy()
+        # mask the raw array rather than dropna() so no intermediate frame is built
+        pieces.append(pd.DataFrame({'Group': group, 'Value': values[~pd.isna(values)]}))
+    if not pieces:
+        return pd.DataFrame(columns=['Group', 'Value'])
+    return pd.concat(pieces, ignore_index=True)
+
+def downcast_numeric(data):
+    """Downcast float columns to float32 and integer columns to the smallest int dtype, in place; other columns are left alone."""
+    import pandas as pd
+    for col in data.columns:
+        if pd.api.types.is_integer_dtype(data[col]):
+            data[col] = pd.to_numeric(data[col], downcast='integer')
+        elif pd.api.types.is_float_dtype(data[col]):
+            data[col] = pd.to_numeric(data[col], downcast='float')
+    return data
+
+def read_columns(path, usecols):
+    """Read only usecols, with pandas' multithreaded pyarrow parser when pyarrow is installed."""
+    import pandas as pd
+    # pyarrow repeats a column named twice in usecols; the C engine does not
+    usecols = list(dict.fromkeys(usecols))
+    try:
+        data = pd.read_csv(path, usecols=usecols, engine='pyarrow')
+    except (ImportError, KeyError, ValueError):
+        # no pyarrow, or a file only the C engine handles: the header names come from a C-engine read
+        # ('Unnamed: 1' for blank cells, 'a.1' for repeats), which pyarrow reports as missing
+        # (ArrowKeyError), and pyarrow rejects ragged rows (ArrowInvalid / ParserError)
+        data = pd.read_csv(path, usecols=usecols)
+    return downcast_numeric(data)
+
+def read_csv_chunks(path, group_cols, chunksize=CHUNK_SIZE):
+    """Read only the columns used by the groups, chunksize rows at a time (C engine; pyarrow has no chunksize)."""
+    import pandas as pd
+    # no downcast here: it costs a pass and rounds values that the sums and histograms widen back to float64
+    with pd.read_csv(path, usecols=selected_columns(group_cols), chunksize=chunksize) as reader:
+        yield from reader
+
+def parse_grouped_columns_agg(group_cols, chunks, agg='values'):
+    """Aggregate each group's columns over an iterable of frames (e.g. read_csv_chunks).
+    agg='values': long-form Group/Value frame of every non-null value (box).
+    agg='arrays': {group: [float64 array of non-NaN values per chunk]}, in command-line order, without a long-form frame (histogram).
+    agg='mean': one Group/Value row per group with its mean, from running sums and counts (bar)."""
+    import pandas as pd
+    if agg == 'values':
+        pieces = [parse_grouped_columns(group_cols, chunk) for chunk in chunks]
+        if not pieces:
+            return pd.DataFrame(columns=['Group', 'Value'])
+        return pd.concat(pieces, ignore_index=True)
+    if agg == 'arrays':
+        arrays = {}
+        for chunk in chunks:
+            for group, cols in group_cols:
+                # column after column, the same order melt produces
+                values = chunk[cols].to_numpy(dtype=np.float64).ravel(order='F')
+                arrays.setdefault(group, []).append(values[~np.isnan(values)])
+        return arrays
+    if agg == 'mean':
+        sums = {}
+        counts = {}
+        for chunk in chunks:
+            for group, cols in group_cols:
+                s, c = sum_count(chunk[cols].to_numpy(dtype=np.float64))
+                sums[group] = sums.get(group, 0.0) + s.sum()
+                counts[group] = counts.get(group, 0) + int(c.sum())
+        # same groups and order as groupby('Group').mean() on the long-form data
+        groups = sorted(group for group in counts if counts[group])
+        return pd.DataFrame({'Group': groups, 'Value': [sums[group] / counts[group] for group in groups]})
+    raise ValueError(f"Unknown aggregation: {agg}")
 
 def get_palette(palette_arg):
     """Parse palette argument for seaborn."""
@@ -96,89 +261,144 @@ def get_palette(palette_arg):
 
 def main():
     args = parse_args()
-    data = pd.read_csv(args.file)
+    import pandas as pd
+    import matplotlib
+    if args.output:
+        # no window is opened when saving, so skip the interactive backend's GUI setup
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    # header only; each graph type then reads just the columns it needs
+    header = pd.read_csv(args.file, nrows=0)
     graph_type = args.graph_type
     columns = args.columns
     palette = get_palette(args.palette)
 
-    plt.figure(figsize=(10, 6))
+    fig, ax = plt.subplots(figsize=(10, 6))
 
     if graph_type == 'scatter':
         if len(columns) != 2:
             print('Scatter plot requires exactly 2 columns by names or indices.', file=sys.stderr)
             sys.exit(1)
         # Support both index and name for scatter plot
-        col_indices = []
-        for col in columns:
-            if re.match(r"^\d+$", col):
+        cols = header.columns
+        ncols = len(cols)
+        # look up every name in one call; integer tokens are positions and take precedence
+        positions = cols.get_indexer(columns)
+        for i, col in enumerate(columns):
+            if INT_COL_RE.match(col):
                 idx = int(col)
-                if idx < 0 or idx >= len(data.columns):
+                if idx >= ncols:
                     print(f"Error: Column index {idx} out of range.", file=sys.stderr)
                     sys.exit(1)
-                col_indices.append(data.columns[idx])
-            elif col in data.columns:
-                col_indices.append(col)
-            else:
+                positions[i] = idx
+            elif positions[i] == -1:
                 print(f"Error: Column '{col}' not found.", file=sys.stderr)
                 sys.exit(1)
+        col_indices = list(cols[positions])
+        data = read_columns(args.file, col_indices)
         colors = None
         if palette:
             if isinstance(palette, list):
                 colors = palette if len(palette) == 2 else palette[0]
             else:
                 colors = palette
-        plt.scatter(data[col_indices[0]], data[col_indices[1]], c=colors)
-        plt.xlabel(args.xlabel or col_indices[0])
-        plt.ylabel(args.ylabel or col_indices[1])
-        plt.title(args.title or f"Scatter plot of {col_indices[0]} vs {col_indices[1]}")
+        x, y = (data.iloc[:, i].to_numpy() for i in data.columns.get_indexer(col_indices))
+        # drop rows missing either coordinate with one combined mask
+        numeric = x.dtype.kind in 'fiu' and y.dtype.kind in 'fiu'
+        keep = np.isfinite(x) & np.isfinite(y) if numeric else ~(pd.isna(x) | pd.isna(y))
+        x, y = x[keep], y[keep]
+        if numeric and x.size > SCATTER_HEXBIN_POINTS:
+            ax.hexbin(x, y, gridsize=200, cmap='viridis', mincnt=1)
+        else:
+            ax.scatter(x, y, c=colors, rasterized=True)
+        ax.set_xlabel(args.xlabel or col_indices[0])
+        ax.set_ylabel(args.ylabel or col_indices[1])
+        ax.set_title(args.title or f"Scatter plot of {col_indices[0]} vs {col_indices[1]}")
     elif graph_type == 'box':
-        df_long = parse_grouped_columns(columns, data)
+        import seaborn as sns
+        group_cols = parse_group_spec(columns, header)
+        df_long = parse_grouped_columns_agg(group_cols, read_csv_chunks(args.file, group_cols))
         if df_long.empty:
             print("Error: No data to plot.", file=sys.stderr)
             sys.exit(1)
-        sns.boxplot(x='Group', y='Value', data=df_long, palette=palette)
-        plt.xlabel(args.xlabel or "Group")
-        plt.ylabel(args.ylabel or "Value")
-        plt.title(args.title or "Box Plot")
+        # command-line order rather than first appearance, which with chunked reads depends on where each group's first value falls
+        present = set(df_long['Group'])
+        order = [group for group in dict.fromkeys(group for group, _ in group_cols) if group in present]
+        sns.boxplot(x='Group', y='Value', data=df_long, order=order, palette=palette, ax=ax)
+        ax.set_xlabel(args.xlabel or "Group")
+        ax.set_ylabel(args.ylabel or "Value")
+        ax.set_title(args.title or "Box Plot")
     elif graph_type == 'violin':
-        col_indices = expand_column_indices(columns, data)
-        sns.violinplot(data=data[col_indices], palette=palette)
-        plt.xlabel(args.xlabel or "Column")
-        plt.ylabel(args.ylabel or "Value")
-        plt.title(args.title or "Violin plot for selected columns")
+        import seaborn as sns
+        col_indices = expand_column_indices(columns, header)
+        data = read_columns(args.file, col_indices)
+        if len(data) > VIOLIN_MAX_POINTS:
+            data = data.sample(n=VIOLIN_MAX_POINTS, random_state=0)
+        # numeric columns only, each once, as seaborn's wide-form DataFrame input plotted them
+        numeric = data[list(dict.fromkeys(col_indices))].select_dtypes('number')
+        if numeric.columns.empty:
+            print("Error: No numeric columns to plot.", file=sys.stderr)
+            sys.exit(1)
+        # plain 2-D array so seaborn doesn't copy a DataFrame slice; names go back on as tick labels
+        sns.violinplot(data=numeric.to_numpy(dtype=float), palette=palette, ax=ax)
+        ax.set_xticks(range(len(numeric.columns)), list(numeric.columns))
+        ax.set_xlabel(args.xlabel or "Column")
+        ax.set_ylabel(args.ylabel or "Value")
+        ax.set_title(args.title or "Violin plot for selected columns")
     elif graph_type == 'bar':
-        df_long = parse_grouped_columns(columns, data)
-        if df_long.empty:
+        import seaborn as sns
+        group_cols = parse_group_spec(columns, header)
+        group_means = parse_grouped_columns_agg(group_cols, read_csv_chunks(args.file, group_cols), agg='mean')
+        if group_means.empty:
             print("Error: No data to plot.", file=sys.stderr)
             sys.exit(1)
-        group_means = df_long.groupby('Group')['Value'].mean().reset_index()
-        sns.barplot(x='Group', y='Value', data=group_means, palette=palette)
-        plt.xlabel(args.xlabel or "Group")
-        plt.ylabel(args.ylabel or "Mean Value")
-        plt.title(args.title or "Bar Plot (Mean Value)")
+        sns.barplot(x='Group', y='Value', data=group_means, palette=palette, ax=ax)
+        ax.set_xlabel(args.xlabel or "Group")
+        ax.set_ylabel(args.ylabel or "Mean Value")
+        ax.set_title(args.title or "Bar Plot (Mean Value)")
     elif graph_type == 'histogram':
-        df_long = parse_grouped_columns(columns, data)
-        if df_long.empty:
+        group_cols = parse_group_spec(columns, header)
+        group_arrays = parse_grouped_columns_agg(group_cols, read_csv_chunks(args.file, group_cols), agg='arrays')
+        group_values = {group: np.concatenate(arrays) for group, arrays in group_arrays.items()}
+        # groups with no values get no histogram, as with a groupby on long-form data
+        group_values = {group: values for group, values in group_values.items() if values.size}
+        if not group_values:
             print("Error: No data to plot.", file=sys.stderr)
             sys.exit(1)
-        for idx, (group, group_df) in enumerate(df_long.groupby('Group')):
-            color = None
-            if palette:
-                if isinstance(palette, list):
-                    color = palette[idx % len(palette)]
-                else:
-                    color = palette
-            sns.histplot(group_df['Value'], label=group, kde=False, bins=20, alpha=0.5, color=color)
-        plt.xlabel(args.xlabel or "Value")
-        plt.ylabel(args.ylabel or "Frequency")
-        plt.title(args.title or "Grouped Histogram")
-        plt.legend(title="Group")
+        # bin every group against the same HIST_BINS edges with one bincount pass each, and draw the counts directly
+        lo = float(min(values.min() for values in group_values.values()))
+        hi = float(max(values.max() for values in group_values.values()))
+        if hi == lo:
+            # same widening np.histogram uses for a constant sample
+            lo, hi = lo - 0.5, hi + 0.5
+        edges = np.linspace(lo, hi, HIST_BINS + 1)
+        scale = HIST_BINS / (hi - lo)
+        # resolve the palette form once instead of per group
+        if not palette:
+            # stairs() doesn't advance the color cycle when given color=, so step through it explicitly ('C0', 'C1', ...)
+            color_for = lambda idx: f"C{idx}"
+        elif isinstance(palette, list):
+            color_for = lambda idx: palette[idx % len(palette)]
+        else:
+            color_for = lambda idx: palette
+        # groups (and their palette colors) stay in command-line order
+        for idx, (group, values) in enumerate(group_values.items()):
+            bins = np.clip(((values - lo) * scale).astype(np.int64), 0, HIST_BINS - 1)
+            counts = np.bincount(bins, minlength=HIST_BINS)
+            ax.stairs(counts, edges, label=group, fill=True, alpha=0.5, color=color_for(idx))
+        ax.set_xlabel(args.xlabel or "Value")
+        ax.set_ylabel(args.ylabel or "Frequency")
+        ax.set_title(args.title or "Grouped Histogram")
+        ax.legend(title="Group")
     else:
         print('Unsupported graph type.', file=sys.stderr)
         sys.exit(1)
 
-    plt.tight_layout()
-    plt.show()
+    fig.tight_layout()
+    if args.output:
+        fig.savefig(args.output, dpi=120, bbox_inches='tight')
+    else:
+        plt.show()
 
 if __name__ == '__main__':
     main()
@@ -194,4 +414,5 @@ if __name__ == '__main__':
 #--title "title"
 #--xlabel "label"
 #--ylabel "label"
-#--palette "colors in order left to right separated by comma"
\ No newline at end of file
+#--palette "colors in order left to right separated by comma"
+#--output "plot.png" (saves the figure instead of opening a window)
\ No newline at end of file